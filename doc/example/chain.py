@@ -1,8 +1,8 @@
 #!/usr/bin/env python
 #
-# Example script showing how to use dependencies and job chains
+# Example script showing how to use dependencies, job chains and job arrays
 
-# We want to submit 8 jobs with the following dependency graph:
+# We want to run 8 jobs with the following dependency graph:
 #
 #           preprocessing
 #           /           \
@@ -19,34 +19,49 @@
 # 'job_b1' -> 'job_b2' -> 'job_b3'.
 # Within one chain, every next job starts when the previous one is completed.
 # 'postprocessing' depends on both 'job_a3' and 'job_b3'.
+#
+# Jobs 'job_aN' and 'job_bN' form step N and are submitted together as
+# a job array of two tasks: task 1 is 'job_aN' and task 2 is 'job_bN'.
+# Steps are chained with 'aftercorr' dependencies, i.e. task 1 (2) of step N+1
+# starts when task 1 (2) of step N has successfully completed. This way
+# only 5 jobs are submitted instead of 8.
 
-# Import SLURMJob class, chain_jobs() and submit()
+# Import SLURMJob class, chain_jobs() and submit_all()
 from slurm_factory.job import *
 
 # 'timedelta' represents time durations
 from datetime import timedelta
 
+# 'chain' iterates over several sequences without concatenating them
+from itertools import chain
+
 # This job will pre-process data
 preprocessing = SLURMJob(job_name = "preprocessing",        # Job name
                          nodes = 1,                         # Number of requested nodes
                          walltime = timedelta(minutes = 20) # Wall time
                         )
 
-# Jobs of chain A
-jobs_a = [SLURMJob(job_name = "job_a" + str(n),
-                   nodes = 8,
-                   walltime = timedelta(hours = 6)
-                   ) for n in (1,2,3)]
+# Wall time of every job in chains A and B
+chain_walltime = timedelta(hours = 6)
+
+# Steps 1, 2 and 3 of both chains
+steps = [SLURMJob(job_name = "step%i" % n,
+                  nodes = 8,
+                  walltime = chain_walltime
+                  ) for n in (1,2,3)]
 
-# Jobs of chain B
-jobs_b = [SLURMJob(job_name = "job_b" + str(n),
-                   nodes = 8,
-                   walltime = timedelta(hours = 6)
-                   ) for n in (1,2,3)]
+for step in steps:
+    # Task 1 belongs to chain A, task 2 to chain B
+    step.job_array([1, 2])
+    step.set_body("""
+case $SLURM_ARRAY_TASK_ID in
+1) srun -n ${SLURM_NTASKS} ./chain_a ;;
+2) srun -n ${SLURM_NTASKS} ./chain_b ;;
+esac
+""")
 
-# Form chains (set dependencies between jobs)
-chain_jobs(jobs_a, 'afterok')
-chain_jobs(jobs_b, 'afterok')
+# Form chains (set dependencies between corresponding tasks of the steps)
+chain_jobs(steps, 'aftercorr')
 
 # This job will post-process computation results
 postprocessing = SLURMJob(job_name = "postprocessing",       # Job name
@@ -54,17 +69,18 @@ postprocessing = SLURMJob(job_name = "postprocessing",       # Job name
                           walltime = timedelta(minutes = 30) # Wall time
                          )
 
-# 'job_a1' and 'job_b1' must depend on 'preprocessing'
-jobs_a[0].add_dependencies('afterok', [preprocessing])
-jobs_b[0].add_dependencies('afterok', [preprocessing])
+# Both tasks of step 1 must depend on 'preprocessing'
+steps[0].add_dependencies('afterok', [preprocessing])
 
-# 'postprocessing' depends on 'job_a3' and 'job_b3'
-postprocessing.add_dependencies('afterok', [jobs_a[2], jobs_b[2]])
+# 'postprocessing' depends on both tasks of step 3
+postprocessing.add_dependencies('afterok', [steps[2]])
 
-# Uncomment to make 'postprocessing' start when AT LEAST ONE of
-# 'job_a3' and 'job_b3' is successfully completed.
-## postprocessing.dependencies_require_any(True)
+# Use this line instead to make 'postprocessing' start when step 3 is
+# completed, even if some of its tasks have failed. With 'afterok',
+# 'postprocessing' would stay pending forever in that case.
+## postprocessing.add_dependencies('afterany', [steps[2]])
 
 # Submit everything
-for job in [preprocessing] + jobs_a + jobs_b + [postprocessing]:
-    submit(job)
+# Jobs that do not depend on each other are submitted in parallel:
+# 'preprocessing' first, then the steps one after another, then 'postprocessing'.
+submit_all(chain((preprocessing,), steps, (postprocessing,)))
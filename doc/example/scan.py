@@ -1,41 +1,37 @@
 #!/usr/bin/env python
 
-# Scan a range of parameter 'x' submitting one job per value
+# Scan a range of parameter 'x' submitting one job array task per value
 
-# Import SLURMJob class and submit()
+# Import SLURMJob, SLURMJobTemplate classes and submit_many()
 from slurm_factory.job import *
 
-# NumPy
-import numpy as np
-
 # Values of 'x': 0, 0.1, 0.2, ..., 1.0
-x_values = np.linspace(0, 1.0, 11)
-
-# List of jobs to be submitted
-jobs = []
-
-# Create jobs
-for x in x_values:
-    job = SLURMJob(job_name = "run_x_%.1f" % x,        # Job name
-                   nodes = 4,                          # Number of requested nodes
-                   walltime = timedelta(minutes = 10)  # Wall time
-                  )
-    # I/O streams of the job
-    job.job_streams(# File for standard output stream
-                    output = "scan_x.out",
-                    # File for standard error stream
-                    error =  "scan_x.err",
-                    # Open the files in the append mode
-                    # to collect output from all jobs in one place
-                    open_mode = 'a')
-    # Add body to the script
-    job.set_body("srun -n ${SLURM_NTASKS} ./scan_x %.1f" % x)
-
-    # Append job to the list
-    jobs.append(job)
-
-# Submit jobs and collect their IDs
-jobids = [submit(job) for job in jobs]
+x_values = [n / 10.0 for n in range(11)]
+
+# Options shared by all jobs
+common = SLURMJob(job_name = "scan_x",                # Job name
+                  nodes = 4,                          # Number of requested nodes
+                  walltime = timedelta(minutes = 10)  # Wall time
+                 )
+# I/O streams of the jobs
+common.job_streams(# File for standard output stream
+                   output = "scan_x.out",
+                   # File for standard error stream
+                   error =  "scan_x.err",
+                   # Open the files in the append mode
+                   # to collect output from all jobs in one place
+                   open_mode = 'a')
+
+# Render the common part of the job scripts only once
+template = SLURMJobTemplate(common)
+
+# Create jobs, only their bodies differ
+jobs = [template.clone(body = "srun -n ${SLURM_NTASKS} ./scan_x %.1f" % x)
+        for x in x_values]
+
+# Submit all jobs as one job array (a single call to sbatch)
+# and collect their IDs, <array job id>_<array task id>
+jobids = submit_many(jobs, as_array = True)
 
 print("Job IDs:")
 print(jobids)
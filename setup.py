@@ -12,8 +12,8 @@ setup(name = 'slurm_factory',
       classifiers = [
         'Development Status :: 2 - Pre-Alpha',
         'License :: OSI Approved :: GNU General Public License v3 or later (GPLv3+)',
-        'Programming Language :: Python :: 2.7',
-        'Programming Language :: Python :: 3.3',
+        'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3.7',
         'Topic :: Scientific/Engineering',
         'Topic :: System :: Clustering',
         'Topic :: System :: Distributed Computing'
@@ -24,6 +24,7 @@ setup(name = 'slurm_factory',
       author_email = 'igor.s.krivenko@gmail.com',
       license = 'GPL',
       packages = ['slurm_factory'],
+      python_requires = '>=3.7',
       include_package_data = True,
       zip_safe = True,
       tests_require = ['nose'],
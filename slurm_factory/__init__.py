@@ -19,14 +19,14 @@
 # this program. If not, see <http://www.gnu.org/licenses/>.
 #
 ###################################################################################
-from __future__ import absolute_import
-
 from .version import (version, version_info,
                       locate_executable, slurm_version, slurm_version_info)
-from .job import SLURMJob, submit, chain_jobs
+from .job import (SLURMJob, SLURMJobTemplate,
+                  submit, submit_and_wait, submit_async, submit_all, submit_many, chain_jobs)
 from .cray import CrayJob
 
 __all__ = ['version', 'version_info',
            'locate_executable', 'slurm_version', 'slurm_version_info',
-           'SLURMJob', 'submit', 'chain_jobs',
+           'SLURMJob', 'SLURMJobTemplate',
+           'submit', 'submit_and_wait', 'submit_async', 'submit_all', 'submit_many', 'chain_jobs',
            'CrayJob']
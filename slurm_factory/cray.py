@@ -20,17 +20,18 @@
 #
 ###################################################################################
 
-# Python 2/3 compatibility
-from __future__ import absolute_import, print_function, unicode_literals
-__metaclass__ = type
-
 from .job import SLURMJob
 
+# Checks of the 'network' option, prebuilt sequence of (check, error message) pairs
+network_checks = ((lambda t: t in ('system','blade'), "network type must be either 'system' or 'blade'"),)
+
 class CrayJob(SLURMJob):
     """
     TODO
     """
 
+    __slots__ = ()
+
     def __init__(self, **kwargs):
         """
         TODO
@@ -41,14 +42,13 @@ class CrayJob(SLURMJob):
         """
         TODO
         """
-        self._add_option('network', type, [(lambda t: t in ('system','blade'),
-                                            "network type must be either 'system' or 'blade'")])
+        self._add_option('network', type, network_checks)
 
     def dump(self):
         """
         TODO
         """
-        if 'network' in self.options:
-            self.options['exclusive'] = True
+        if 'network' in self.options and self.options.get('exclusive') is not True:
+            self._add_option('exclusive', True)
 
         return SLURMJob.dump(self)
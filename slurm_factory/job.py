@@ -20,63 +20,112 @@
 #
 ###################################################################################
 
-# Python 2/3 compatibility
-from __future__ import absolute_import, print_function, unicode_literals
-__metaclass__ = type
-
 import os
 import re
+import sys
+from copy import copy
 from subprocess import Popen, PIPE
+from tempfile import TemporaryFile
+from concurrent.futures import ThreadPoolExecutor
+from threading import Event, Lock, current_thread, local
 from datetime import datetime, date, time, timedelta
-from collections import Iterable, OrderedDict
+from collections.abc import Iterable
 from warnings import warn
-from inspect import stack
 
 from .version import locate_executable
 
 # Locate default shell
 shell_path = os.environ['SHELL']
 
-# Names of all UNIX signals supported on this platform
-import signal
-all_signals = {k[3:] : v for k, v in sorted(signal.__dict__.items())
-               if k.startswith('SIG') and not k.startswith('SIG_')}
-del signal
+# Names and numbers of all UNIX signals supported on this platform,
+# collected on first use
+all_signals = None
+def get_all_signals():
+    global all_signals
+    if all_signals is None:
+        import signal
+        # __members__ also lists aliases, such as SIGIOT for SIGABRT
+        members = signal.Signals.__members__
+        all_signals = frozenset(k[3:] for k in members) | frozenset(v.value for v in members.values())
+    return all_signals
+
+# Job dependency types that can chain jobs
+chain_dep_types = ('after','afterany','afterburstbuffer','aftercorr','afternotok','afterok')
+# All job dependency types
+all_dep_types = chain_dep_types + ('expand','singleton')
+# Comma-separated lists of the above for error messages
+chain_dep_types_list = ','.join(chain_dep_types)
+all_dep_types_list = ','.join(all_dep_types)
+# Dependency type used by chain_jobs() by default
+# ('afterany' does not leave the chain blocked forever when a job fails)
+default_dep_type = 'afterany'
 
-# RegExp for job_id extraction
-parse_job_id_regexp = re.compile(r"^(\d+)$")
 # RegExp for filename pattern validation
-filename_pattern_regexp = re.compile(r"%\d*[%AaJjNnstux]")
-# RegExp list for constraints validation
-constraints_regexps = (r"^\w+(\*\d)*(,\w+(\*\d)*)*$",      # List
-                       r"^\w+(\*\d)*(\|\w+(\*\d)*)*$",     # OR
-                       r"^\w+(\*\d)*(&\w+(\*\d)*)*$",      # AND
-                       r"^\[\w+(\*\d)*(\|\w+(\*\d)*)*\]$") # Matching OR
-constraints_regexps = tuple(re.compile(r) for r in constraints_regexps)
-# RegExp for memory size expressions
-memory_size_regexp = re.compile(r"^[0-9]+[KMGT]$")
-# RegExp for reservation names
-reservation_regexp = re.compile(r"^[_\-a-z0-9]*$")
+# (a filename must consist of characters other than '%' and valid replacement symbols)
+filename_pattern_regexp = re.compile(r"(?:[^%]|%\d*[%AaJjNnstux])*\Z", re.ASCII)
+# RegExp for constraints validation
+constraints_regexp = (r"\w+(\*\d)*(,\w+(\*\d)*)*",      # List
+                      r"\w+(\*\d)*(\|\w+(\*\d)*)*",     # OR
+                      r"\w+(\*\d)*(&\w+(\*\d)*)*",      # AND
+                      r"\[\w+(\*\d)*(\|\w+(\*\d)*)*\]") # Matching OR
+constraints_regexp = re.compile(r"^(?:%s)\Z" % '|'.join(constraints_regexp), re.ASCII)
+# Digits of memory size expressions '<number>[KMGT]'
+memory_size_digits = "0123456789"
+# Translation table deleting all characters allowed in reservation names
+reservation_chars_table = str.maketrans('', '', "_-abcdefghijklmnopqrstuvwxyz0123456789")
+# RegExp for e-mail addresses (user names of local users are also accepted)
+email_regexp = re.compile(r"^[^@\s]+(@[^@\s]+)?\Z", re.ASCII)
+# RegExp for job IDs returned as strings, '<job ID>' or '<array job ID>_<index>'
+job_id_regexp = re.compile(r"^\d+(_\d+)?\Z", re.ASCII)
 
 # Validate filename pattern
+# (results are memoized, the same patterns tend to recur in many jobs)
+filename_patterns_cache = {}
 def valid_filename_patterns(filename):
-    if r'\\' in filename: return True
-    return ('%' not in re.sub(filename_pattern_regexp,'', filename))
+    # Plain file names without replacement symbols are always valid
+    if '%' not in filename: return True
+    valid = filename_patterns_cache.get(filename)
+    if valid is None:
+        if len(filename_patterns_cache) >= 256: filename_patterns_cache.clear()
+        valid = r'\\' in filename or filename_pattern_regexp.match(filename) is not None
+        filename_patterns_cache[filename] = valid
+    return valid
 
 # Validate memory size int/string
 def valid_memory_size(size):
     return (isinstance(size, int) and size > 0) or \
-           (isinstance(size, str) and not memory_size_regexp.match(size) is None)
+           (isinstance(size, str) and len(size) > 1 and size[-1] in "KMGT" and
+            not size[:-1].strip(memory_size_digits))
 
 # Validate reservation name
 def valid_reservation(reservation):
-    return (not reservation_regexp.match(reservation) is None)
+    return not reservation.translate(reservation_chars_table)
+
+# Validate e-mail address
+def valid_email(email):
+    return (email_regexp.match(email) is not None)
+
+# Validate e-mail notification event types
+all_mail_types = ('BEGIN', 'END', 'FAIL', 'REQUEUE', 'ALL', 'STAGE_OUT',
+                  'TIME_LIMIT', 'TIME_LIMIT_90', 'TIME_LIMIT_80', 'TIME_LIMIT_50')
+def valid_mail_types(types):
+    for t in types:
+        if t not in all_mail_types: return False
+    return True
 
 # Validate generic consumable resources
 def valid_gres(gres):
     if isinstance(gres, str): return True
     if len(gres) > 3: return False
-    return all(isinstance(f, t) for f, t in zip(gres, (str, int, str)))
+    for f, t in zip(gres, (str, int, str)):
+        if not isinstance(f, t): return False
+    return True
+
+# Validate list of generic consumable resources
+def valid_gres_list(gres_list):
+    for gres in gres_list:
+        if not valid_gres(gres): return False
+    return True
 
 # Validate license
 def valid_license(license):
@@ -84,9 +133,16 @@ def valid_license(license):
     if len(license) > 2: return False
     return isinstance(license[0], str) and isinstance(license[1], int)
 
+# Validate list of licenses
+def valid_license_list(licenses):
+    for license in licenses:
+        if not valid_license(license): return False
+    return True
+
 # Validate job object
 def valid_job(job):
-    return isinstance(job, SLURMJob) or isinstance(job, int)
+    return isinstance(job, SLURMJob) or isinstance(job, int) or \
+           (isinstance(job, str) and job_id_regexp.match(job) is not None)
 
 # Add #SBATCH option line
 def render_option(name, value = None):
@@ -95,46 +151,242 @@ def render_option(name, value = None):
     else:
         return "#SBATCH --%s\n" % name
 
+# First line of every job script
+shebang_line = "#!%s\n" % shell_path
+# Option lines closing the header of every job script
+# (--parsable is supported since SLURM 2.6)
+standard_option_lines = render_option("parsable") + render_option("quiet")
+
 # Print a timedelta object in SLURM format
 def format_timedelta(td):
-    if td.total_seconds() < 3600:
-        return "%02i:%02i" % (td.seconds/60, td.seconds%60)
+    days, seconds = td.days, td.seconds
+    # Durations shorter than an hour are the most common ones
+    # (negative durations are printed as minutes and seconds of td.seconds as well)
+    if days < 0 or (days == 0 and seconds < 3600):
+        return "%02i:%02i" % divmod(seconds, 60)
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    if days > 0:
+        return "%i-%02i:%02i:%02i" % (days, hours, minutes, seconds)
     else:
-        hours = td.seconds / 3600
-        seconds = td.seconds % 3600
-        if td.days == 0:
-            return "%02i:%02i:%02i" % (hours, seconds/60, seconds%60)
-        else:
-            return "%i-%02i:%02i:%02i" % (td.days, hours, seconds/60, seconds%60)
+        return "%02i:%02i:%02i" % (hours, minutes, seconds)
 
 # Format GRES string
 def format_gres(g):
     if isinstance(g, str): return g
-    s = str(g[0])
+    s = g[0]
     if len(g) == 2:   s += ":%i" % g[1]
     elif len(g) == 3: s += ":%s:%i" % (g[2], g[1])
     return s
 
+# Format 'begin' option for all supported argument types
+begin_renderers = {
+    str :       lambda s: s,
+    date :      date.isoformat,
+    time :      time.isoformat,
+    datetime :  datetime.isoformat,
+    timedelta : lambda s: 'now+' + (str(s.days)+"days" if s.days > 0 else str(s.seconds))
+}
+
 # Format license string
 def format_license(license):
     return "%s:%s" % license if isinstance(license, tuple) else license
 
+# Format job array indexes, collapsing consecutive indexes into ranges
+def format_array_indexes(indexes):
+    runs = []
+    for i in sorted(set(indexes)):
+        if runs and i == runs[-1][1] + 1:
+            runs[-1][1] = i
+        else:
+            runs.append([i, i])
+    return ','.join(str(a) if a == b else "%i-%i" % (a, b) for a, b in runs)
+
+# Build a job array script body that dispatches on $SLURM_ARRAY_TASK_ID
+def render_array_body(bodies):
+    parts = ["case $SLURM_ARRAY_TASK_ID in\n"]
+    parts += ["%i)\n%s\n;;\n" % (n, body.rstrip('\n')) for n, body in enumerate(bodies)]
+    parts.append("esac\n")
+    return ''.join(parts)
+
+# Unsubmitted SLURMJob objects a job depends on
+def pending_dependencies(job):
+    return [dep for dep_type, deps in job.dependencies.items() if dep_type != 'singleton'
+                for dep in deps if isinstance(dep, SLURMJob) and not dep.submitted]
+
+# Check whether a job is a job array itself, directly or through its template
+def is_job_array(job):
+    return 'array' in job.options or \
+           (job._template is not None and 'array' in job._template.options)
+
+# Shells that understand the 'case' statement of merged job array scripts
+posix_shells = frozenset(('sh', 'bash', 'dash', 'ash', 'ksh', 'mksh', 'pdksh', 'zsh'))
+
+# Can a job become a task of a merged job array?
+# (merged bodies are dispatched by a POSIX 'case' statement in the default
+# shell, and '#SBATCH' lines in a body would have no effect after it)
+def array_mergeable(job):
+    return os.path.basename(shell_path) in posix_shells and \
+           not is_job_array(job) and '#SBATCH' not in job.body
+
+# Can two jobs be merged into one job array?
+# (they must differ only in their bodies and must both be mergeable)
+def array_compatible(job1, job2):
+    return array_mergeable(job1) and array_mergeable(job2) and \
+           type(job1) is type(job2) and \
+           job1._template is job2._template and \
+           job1.options == job2.options and \
+           job1.dependencies == job2.dependencies and \
+           job1.deps_require_any == job2.deps_require_any and \
+           job1._removed_options == job2._removed_options
+
+# Thread pool for asynchronous job submission, created on first use
+# with SLURM_FACTORY_SUBMIT_WORKERS threads (8 by default)
+submit_pool = None
+submit_pool_lock = Lock()
+# Thread-local state, 'in_submit_pool' is set in threads of submit_pool
+submit_thread_state = local()
+
+def mark_submit_pool_thread():
+    submit_thread_state.in_submit_pool = True
+
+def get_submit_pool():
+    global submit_pool
+    with submit_pool_lock:
+        if submit_pool is None:
+            submit_pool = ThreadPoolExecutor(int(os.environ.get('SLURM_FACTORY_SUBMIT_WORKERS', 8)),
+                                             initializer = mark_submit_pool_thread)
+    return submit_pool
+
+# Thread pool for submission of multiple jobs, either the shared one
+# or a new one of a given size that must be shut down by the caller
+def submission_pool(concurrency):
+    if concurrency is None: return get_submit_pool()
+    assert_(concurrency > 0, "'concurrency' must be positive")
+    return ThreadPoolExecutor(concurrency)
+
+# Call function(item, sbatch_path) for all items on a pool and wait for all calls to return.
+# Threads of the shared pool make the calls themselves: waiting for other threads
+# of the same pool could leave it without free threads and deadlock.
+def run_on_pool(pool, function, items, sbatch_path):
+    if pool is submit_pool and getattr(submit_thread_state, 'in_submit_pool', False):
+        for item in items: function(item, sbatch_path)
+    else:
+        for f in [pool.submit(function, item, sbatch_path) for item in items]: f.result()
+
+# Submission of a job by a thread
+class Submission:
+    __slots__ = ('done', 'finished', 'thread', 'wait', 'error')
+
+    def __init__(self, wait):
+        # Set once the job is submitted or its submission has failed
+        self.done = Event()
+        # Set once the submission is over, with 'wait' once the job has terminated
+        self.finished = Event()
+        self.thread = current_thread()
+        self.wait = wait
+        # Error message of a failed submission or job
+        self.error = None
+
+# Submissions in progress, {id(job) : Submission}
+submissions = {}
+# Jobs other threads are submitting and a thread is waiting for, {thread : id(job)}
+waiting_for = {}
+submissions_lock = Lock()
+
+# Raise RuntimeError if waiting for a job submitted by thread 'owner' would close
+# a cycle of threads waiting for each other's jobs (called with submissions_lock held)
+def check_wait_cycle(owner):
+    while owner is not current_thread():
+        in_progress = submissions.get(waiting_for.get(owner))
+        if in_progress is None: return
+        owner = in_progress.thread
+    raise RuntimeError("circular dependencies between jobs")
+
+# Special values of the 'begin' option
+begin_time_txt = ('midnight', 'noon', 'fika', 'teatime', 'today', 'tomorrow')
+
+# Checks of option arguments, prebuilt sequences of (check, error message) pairs
+# keyed by argument names
+positive = lambda n: n > 0
+non_negative_td = lambda td: td >= timedelta(0)
+option_checks = {
+    'time' :        ((non_negative_td, "negative 'time' durations are not allowed"),),
+    'time_min' :    ((non_negative_td, "negative 'time_min' durations are not allowed"),),
+    'open_mode' :   ((lambda m: m in ('w','a'), "invalid open mode"),),
+    'mail_user' :   ((valid_email, "invalid e-mail address"),),
+    'mail_type' :   ((valid_mail_types, "invalid event type"),),
+    'exclusive' :   ((lambda e: e is True or e in ('user','mcs'), "invalid 'exclusive' option"),),
+    'constraints' : ((lambda c: constraints_regexp.match(c) is not None, "invalid constraints"),),
+    'gres' :        ((valid_gres_list, "invalid generic consumable resources"),),
+    'nodelist' :    ((lambda nl: isinstance(nl, Iterable), "'nodelist' must be iterable"),),
+    'exclude' :     ((lambda ex: isinstance(ex, Iterable), "'exclude' must be iterable"),),
+    'switches' :    ((lambda sw: isinstance(sw, int) or (len(sw) == 2 and sw[0] > 0 and sw[1] >= timedelta(0)),
+                      "invalid 'switches' specification"),),
+    'reservation' : ((valid_reservation, "invalid reservation name"),),
+    'begin' :       ((lambda b: isinstance(b, (date, time, datetime, timedelta)) or (b in begin_time_txt),
+                      "'begin' has a wrong type"),
+                     (lambda b: not isinstance(b, timedelta) or b.days >= 0,
+                      "negative 'begin' durations are not allowed")),
+    'deadline' :    ((lambda d: isinstance(d, (date, time, datetime)),
+                      "'deadline' has a wrong type"),),
+    'export_file' : ((lambda ef: isinstance(ef, str) or isinstance(ef, int), "invalid 'export_file' value"),),
+    'indexes' :     ((lambda ii: len(ii) > 0 and all(isinstance(i, int) and i >= 0 for i in ii),
+                      "array indexes must be non-negative integers"),)
+}
+option_checks.update({p : ((positive, "'%s' must be positive" % p),)
+                      for p in ('minnodes', 'maxnodes', 'ntasks', 'cpus_per_task', 'ntasks_per_node',
+                                'ntasks_per_socket', 'ntasks_per_core', 'cores', 'threads', 'mincpus',
+                                'sockets_per_node', 'cores_per_socket', 'threads_per_core')})
+option_checks.update({p : ((valid_memory_size, "invalid size argument to '%s' option" % p),)
+                      for p in ('mem', 'mem_per_cpu', 'tmp')})
+option_checks.update({s : ((valid_filename_patterns, "invalid filename pattern in '%s' argument" % s),)
+                      for s in ('output', 'error', 'input')})
+
+# Checks of options that cannot be set together, (check, error message) pairs.
+# They are run on the options a clone inherits from its template together with its own options.
+merged_options_checks = (
+    (lambda o: not('mem' in o and 'mem-per-cpu' in o),
+     "'mem' and 'mem_per_cpu' options are mutually exclusive"),
+    (lambda o: not(o.get('exclusive') is True and 'oversubscribe' in o),
+     "'exclusive' and 'oversubscribe' options are mutually exclusive"),
+    (lambda o: not('core-spec' in o and 'thread-spec' in o),
+     "'cores' and 'threads' options are mutually exclusive"),
+    (lambda o: not('requeue' in o and 'no-requeue' in o),
+     "'requeue' and 'no-requeue' options are mutually exclusive")
+)
+
 # A bit more advanced asserts
-def assert_(cond, msg):
-    assert cond, stack()[1][3] + ": " + msg
+# (msg is %-formatted with args only when the assertion fails)
+def assert_(cond, msg, *args):
+    if __debug__ and not cond:
+        raise AssertionError(sys._getframe(1).f_code.co_name + ": " + (msg % args if args else msg))
 
 def assert_no_args_left(kwargs):
-    assert_(not kwargs, "unexpected keyword arguments %s" % ','.join(kwargs.keys()))
+    assert_(not kwargs, "unexpected keyword arguments %s", ','.join(kwargs))
 
 class SLURMJob:
     """Description of a SLURM job"""
 
+    __slots__ = ('submitted', 'job_id', 'options', 'body',
+                 'dependencies', 'deps_require_any',
+                 '_dump_cache', '_encoded_dump_cache', '_template', '_removed_options')
+
     def __init__(self, **kwargs):
         self.submitted = False
 
         # Dictionary of all options
         # Each option is either True or option's argument
-        self.options = OrderedDict()
+        self.options = {}
+
+        # Rendered job script, reset by every setter that changes options or body
+        self._dump_cache = None
+        # (rendered job script, its UTF-8 encoding) pair
+        self._encoded_dump_cache = None
+        # Template this job has been cloned from
+        self._template = None
+        # Template's options unset by arguments of SLURMJobTemplate.clone() or by setters
+        self._removed_options = frozenset()
 
         # Job Name
         self.job_name(kwargs.pop('job_name', None))
@@ -158,17 +410,17 @@ class SLURMJob:
         self.set_body(kwargs.pop('body', ''))
 
         # List of jobs, this job depends on
-        self.dependencies = {t : [] for t in ('after','afterany','afternotok','afterok','expand','singleton')}
+        self.dependencies = {t : [] for t in all_dep_types}
         # Any dependency may be satisfied / all dependencies must be satisfied
         self.deps_require_any = False
 
     # Some options need to be rendered in a special way
     renderers = {
-        'partition' :       lambda arg: arg if isinstance(arg, str) else ','.join(map(str, arg)),
+        'partition' :       lambda arg: arg if isinstance(arg, str) else ','.join(arg),
         'time' :            format_timedelta,
         'time-min' :        format_timedelta,
         'exclusive' :       lambda arg: None if arg is True else arg,
-        'nodes' :           lambda arg: '-'.join(map(str, arg)),
+        'nodes' :           lambda arg: "%i-%i" % arg if len(arg) == 2 else str(arg[0]),
         'gres' :            lambda arg: ','.join(map(format_gres, arg)),
         'gres-flags' :      lambda arg: "enforce-binding",
         'nodelist' :        lambda arg: ','.join(arg),
@@ -177,31 +429,35 @@ class SLURMJob:
         'open-mode' :       lambda arg: {'w' : 'truncate', 'a' : 'append'}[arg],
         'mail-type' :       lambda arg: ','.join(arg),
         'signal' :          lambda arg: "%s%s%s" % ('B:' if arg[2] else '', arg[0], '' if arg[1] is None else '@' + str(arg[1])),
-        'begin' :           lambda arg: { str :       lambda s: s,
-                                          date :      lambda s: s.isoformat(),
-                                          time :      lambda s: s.isoformat(),
-                                          datetime :  lambda s: s.isoformat(),
-                                          timedelta : lambda s: 'now+' + (str(s.days)+"days" if s.days > 0 else str(s.seconds))
-                                        }[type(arg)](arg),
+        'begin' :           lambda arg: begin_renderers[type(arg)](arg),
         'deadline' :        lambda arg: arg.isoformat(),
         'licenses' :        lambda arg: ','.join(map(format_license, arg)),
-        'clusters' :        lambda arg: ','.join(map(str, arg)),
+        'clusters' :        lambda arg: arg if isinstance(arg, str) else ','.join(arg),
         'export' :          lambda arg: ','.join(map(lambda e: "%s=%s" % e if isinstance(e, tuple) else e, arg)),
-        'kill-on-invalid-dep': lambda arg: 'yes' if arg else 'no'
+        'kill-on-invalid-dep': lambda arg: 'yes' if arg else 'no',
+        'array' :           format_array_indexes
     }
 
-    def _add_option(self, name, arg, checks = []):
+    # Unset an option, on a clone also the template's option of the same name
+    def _remove_option(self, name):
+        self._dump_cache = None
+        self.options.pop(name, None)
+        if self._template is not None and name in self._template.options:
+            self._removed_options = self._removed_options | {name}
+
+    def _add_option(self, name, arg, checks = ()):
+        self._dump_cache = None
         if arg is None or arg is False:
-            self.options.pop(name, None)
+            self._remove_option(name)
             return False
         else:
             for check, msg in checks:
-                assert check(arg), "%s: %s" % (stack()[1][3], msg)
+                assert check(arg), "%s: %s" % (sys._getframe(1).f_code.co_name, msg)
             self.options[name] = arg
             return True
 
-    def _add_option_from_dict(self, name, d, d_name, checks = []):
-        if not d_name in d: return False
+    def _add_option_from_dict(self, name, d, d_name, checks = ()):
+        if d_name not in d: return False
         r = self._add_option(name, d[d_name], checks)
         del d[d_name]
         return r
@@ -210,7 +466,8 @@ class SLURMJob:
         """
         TODO
         """
-        self.body = body.replace('\r\n', '\n')
+        self.body = body if '\r' not in body else body.replace('\r\n', '\n')
+        self._dump_cache = None
 
     def job_name(self, name):
         """
@@ -222,15 +479,15 @@ class SLURMJob:
         """
         TODO
         """
+        if names is not None and names is not False and not isinstance(names, str): names = tuple(map(str, names))
         self._add_option('partition', names)
 
     def walltime(self, time = None, time_min = None):
         """
         TODO
         """
-        positive_td = lambda td: td >= timedelta(0)
-        self._add_option('time', time, [(positive_td, "negative 'time' durations are not allowed")])
-        self._add_option('time-min', time_min, [(positive_td, "negative 'time_min' durations are not allowed")])
+        self._add_option('time', time, option_checks['time'])
+        self._add_option('time-min', time_min, option_checks['time_min'])
         if 'time-min' in self.options:
             assert_('time' in self.options, "cannot set 'time_min' without setting 'time'")
             assert_(self.options['time'] >= self.options['time-min'], "'time_min' cannot exceed 'time'")
@@ -239,8 +496,8 @@ class SLURMJob:
         """
         TODO
         """
-        has_min = self._add_option('minnodes', minnodes, [(lambda n: n > 0, "'minnodes' must be positive")])
-        has_max = self._add_option('maxnodes', maxnodes, [(lambda n: n > 0, "'maxnodes' must be positive")])
+        has_min = self._add_option('minnodes', minnodes, option_checks['minnodes'])
+        has_max = self._add_option('maxnodes', maxnodes, option_checks['maxnodes'])
 
         if has_max:
             assert_(has_min, "cannot set 'maxnodes' without setting 'minnodes'")
@@ -248,6 +505,8 @@ class SLURMJob:
             self.options['nodes'] = (self.options.pop('minnodes'), self.options.pop('maxnodes'))
         elif has_min:
             self.options['nodes'] = (self.options.pop('minnodes'),)
+        else:
+            self._remove_option('nodes')
 
         self._add_option('use-min-nodes', use_min_nodes)
 
@@ -255,13 +514,16 @@ class SLURMJob:
         """
         TODO
         """
-        for p in ('ntasks','cpus_per_task','ntasks_per_node','ntasks_per_socket','ntasks_per_core'):
-            self._add_option_from_dict(p.replace('_','-'), kwargs, p, [(lambda n: n > 0, "'%s' must be positive" % p)])
+        for name, p in (('ntasks', 'ntasks'),
+                        ('cpus-per-task', 'cpus_per_task'),
+                        ('ntasks-per-node', 'ntasks_per_node'),
+                        ('ntasks-per-socket', 'ntasks_per_socket'),
+                        ('ntasks-per-core', 'ntasks_per_core')):
+            self._add_option_from_dict(name, kwargs, p, option_checks[p])
 
         self._add_option_from_dict('overcommit', kwargs, 'overcommit')
 
-        self._add_option_from_dict('exclusive', kwargs, 'exclusive',
-                                   [(lambda e: e is True or e in ('user','mcs'), "invalid 'exclusive' option")])
+        self._add_option_from_dict('exclusive', kwargs, 'exclusive', option_checks['exclusive'])
 
         self._add_option_from_dict('oversubscribe', kwargs, 'oversubscribe')
         assert_(not(self.options.get('exclusive', None) is True and 'oversubscribe' in self.options),
@@ -275,8 +537,8 @@ class SLURMJob:
         """
         TODO
         """
-        self._add_option_from_dict('core-spec', kwargs, 'cores', [(lambda n: n > 0, "'cores' must be positive")])
-        self._add_option_from_dict('thread-spec', kwargs, 'threads', [(lambda n: n > 0, "'threads' must be positive")])
+        self._add_option_from_dict('core-spec', kwargs, 'cores', option_checks['cores'])
+        self._add_option_from_dict('thread-spec', kwargs, 'threads', option_checks['threads'])
         assert_(not('core-spec' in self.options and 'thread-spec' in self.options),
                 "'cores' and 'threads' options are mutually exclusive")
 
@@ -286,29 +548,31 @@ class SLURMJob:
         """
         TODO
         """
-        self._add_option_from_dict('mincpus', kwargs, 'mincpus', [(lambda n: n > 0, "'mincpus' must be positive")])
+        self._add_option_from_dict('mincpus', kwargs, 'mincpus', option_checks['mincpus'])
 
-        for p in ('sockets_per_node', 'cores_per_socket', 'threads_per_core'):
-            self._add_option_from_dict(p.replace('_','-'), kwargs, p, [(lambda n: n > 0, "'%s' must be positive" % p)])
+        for name, p in (('sockets-per-node', 'sockets_per_node'),
+                        ('cores-per-socket', 'cores_per_socket'),
+                        ('threads-per-core', 'threads_per_core')):
+            self._add_option_from_dict(name, kwargs, p, option_checks[p])
 
-        for p in ('mem', 'mem_per_cpu', 'tmp'):
-            self._add_option_from_dict(p.replace('_','-'), kwargs, p, [(valid_memory_size, "invalid size argument to '%s' option" % p)])
+        for name, p in (('mem', 'mem'), ('mem-per-cpu', 'mem_per_cpu'), ('tmp', 'tmp')):
+            self._add_option_from_dict(name, kwargs, p, option_checks[p])
         assert_(not('mem' in self.options and 'mem-per-cpu' in self.options), "'mem' and 'mem_per_cpu' options are mutually exclusive")
 
-        self._add_option_from_dict('constraint', kwargs, 'constraints',
-                                   [(lambda c: any(not r.match(c) is None for r in constraints_regexps), "invalid constraints")])
-        self._add_option_from_dict('gres', kwargs, 'gres',
-                                   [(lambda gg: all(valid_gres(g) for g in gg), "invalid generic consumable resources")])
+        self._add_option_from_dict('constraint', kwargs, 'constraints', option_checks['constraints'])
+        # Iterators would be exhausted by the check, store a tuple instead
+        gres = kwargs.get('gres')
+        if gres is not None and gres is not False: kwargs['gres'] = tuple(gres)
+        self._add_option_from_dict('gres', kwargs, 'gres', option_checks['gres'])
         self._add_option_from_dict('gres-flags', kwargs, 'gres_enforce_binding')
 
         self._add_option_from_dict('contiguous', kwargs, 'contiguous')
 
-        self._add_option_from_dict('nodelist', kwargs, 'nodelist', [(lambda nl: isinstance(nl, Iterable), "'nodelist' must be iterable")])
-        self._add_option_from_dict('exclude', kwargs, 'exclude', [(lambda ex: isinstance(ex, Iterable), "'exclude' must be iterable")])
+        self._add_option_from_dict('nodelist', kwargs, 'nodelist', option_checks['nodelist'])
+        self._add_option_from_dict('exclude', kwargs, 'exclude', option_checks['exclude'])
         self._add_option_from_dict('nodefile', kwargs, 'nodefile')
 
-        valid_switches = lambda sw: isinstance(sw, int) or (len(sw) == 2 and sw[0] > 0 and sw[1] >= timedelta(0))
-        self._add_option_from_dict('switches', kwargs, 'switches', [(valid_switches, "invalid 'switches' specification")])
+        self._add_option_from_dict('switches', kwargs, 'switches', option_checks['switches'])
 
         assert_no_args_left(kwargs)
 
@@ -323,9 +587,8 @@ class SLURMJob:
         TODO
         """
         for s in ('output', 'error', 'input'):
-            self._add_option_from_dict(s, kwargs, s,
-                                       [(valid_filename_patterns, "invalid filename pattern in '%s' argument" % s)])
-        self._add_option_from_dict('open-mode', kwargs, 'open_mode', [(lambda m: m in ('w','a'), "invalid open mode")])
+            self._add_option_from_dict(s, kwargs, s, option_checks[s])
+        self._add_option_from_dict('open-mode', kwargs, 'open_mode', option_checks['open_mode'])
 
         assert_no_args_left(kwargs)
 
@@ -333,28 +596,26 @@ class SLURMJob:
         """
         TODO
         """
-        self._add_option('mail-user', mail_user)
-
-        valid_types = ('BEGIN', 'END', 'FAIL', 'REQUEUE', 'ALL', 'STAGE_OUT',
-                       'TIME_LIMIT', 'TIME_LIMIT_90', 'TIME_LIMIT_80', 'TIME_LIMIT_50')
-        self._add_option('mail-type', mail_types, [(lambda t: all((tt in valid_types) for tt in t), "invalid event type")])
+        self._add_option('mail-user', mail_user, option_checks['mail_user'])
+        self._add_option('mail-type', mail_types, option_checks['mail_type'])
 
         if 'mail-type' not in self.options or self.options['mail-type'] == 'NONE':
-            self.options.pop('mail-user', None)
+            self._remove_option('mail-user')
 
     def signal(self, sig_num = None, sig_time = None, shell_only = False):
         """
         TODO
         """
+        self._dump_cache = None
         if sig_num is None:
-            self.options.pop('signal', None)
+            self._remove_option('signal')
             return
 
-        assert_(sig_num in all_signals.keys() or sig_num in all_signals.values(),
-                "unknown signal number/name " + str(sig_num))
+        assert_(sig_num in get_all_signals(),
+                "unknown signal number/name %s", sig_num)
 
         if sig_time is None:
-            self.signal = (sig_num, None, shell_only)
+            self.options['signal'] = (sig_num, None, shell_only)
         elif not 0 <= sig_time <= 0xffff:
             raise AssertionError("signal: 'sig_time' must be an integer between 0 and 65535")
         else:
@@ -364,28 +625,20 @@ class SLURMJob:
         """
         TODO
         """
-        self._add_option('reservation', reservation, [(valid_reservation, "invalid reservation name")])
+        self._add_option('reservation', reservation, option_checks['reservation'])
 
     def defer_allocation(self, begin = None, immediate = False):
         """
         TODO
         """
         self._add_option('immediate', immediate)
-
-        time_txt = ('midnight', 'noon', 'fika', 'teatime', 'today', 'tomorrow')
-        self._add_option('begin', begin,
-            [(lambda b: any(isinstance(b, t) for t in (date, time, datetime, timedelta)) or (b in time_txt),
-              "'begin' has a wrong type"),
-             (lambda b: not (isinstance(b, timedelta) and begin.days < 0),
-              "negative 'begin' durations are not allowed")])
+        self._add_option('begin', begin, option_checks['begin'])
 
     def deadline(self, deadline = None):
         """
         TODO
         """
-        self._add_option('deadline', deadline,
-                         [(lambda d: any(isinstance(d, t) for t in (date, time, datetime)),
-                           "'deadline' has a wrong type")])
+        self._add_option('deadline', deadline, option_checks['deadline'])
 
     def qos(self, qos = None):
         """
@@ -403,38 +656,42 @@ class SLURMJob:
         """
         TODO
         """
-        self._add_option('licenses', licenses,
-                         [(lambda ll: all(valid_license(l) for l in ll), "invalid licenses %s" % licenses)])
+        # Iterators would be exhausted by the check, store a tuple instead
+        if licenses is not None and licenses is not False:
+            licenses = tuple(licenses)
+            assert_(valid_license_list(licenses), "invalid licenses %s", licenses)
+        self._add_option('licenses', licenses)
 
     def clusters(self, clusters = None):
         """
         TODO
         """
+        if clusters is not None and clusters is not False and not isinstance(clusters, str): clusters = tuple(map(str, clusters))
         self._add_option('clusters', clusters)
 
     def export_env(self, export_vars = None, set_vars = None, export_file = None):
         """
         TODO
         """
+        self._dump_cache = None
         export = []
-        if not export_vars is None:
+        if export_vars is not None:
             if export_vars in ('ALL', 'NONE'):
                 export = [export_vars]
             else:
                 assert_(all(isinstance(v, str) for v in export_vars), "'export_vars' must contain strings")
                 export += export_vars
 
-        if not set_vars is None:
+        if set_vars is not None:
             assert_(all(isinstance(v, str) for v in set_vars.keys()), "keys of 'set_vars' must be strings")
             export += set_vars.items()
 
         if export:
             self.options['export'] = export
         else:
-            del self.options['export']
+            self._remove_option('export')
 
-        has_export_file = self._add_option('export-file', export_file,
-                              [(lambda ef: isinstance(ef, str) or isinstance(ef, int), "invalid 'export_file' value")])
+        has_export_file = self._add_option('export-file', export_file, option_checks['export_file'])
         if has_export_file and isinstance(self.options['export-file'], int):
             try:
                 os.fstat(self.options['export-file'])
@@ -451,12 +708,15 @@ class SLURMJob:
         """
         TODO
         """
+        self._dump_cache = None
         if req is None:
-            self.options.pop('requeue')
-            self.options.pop('no-requeue')
+            self._remove_option('requeue')
+            self._remove_option('no-requeue')
         elif req:
+            self._remove_option('no-requeue')
             self.options['requeue'] = True
         else:
+            self._remove_option('requeue')
             self.options['no-requeue'] = True
 
     def hold(self, hold = None):
@@ -465,22 +725,38 @@ class SLURMJob:
         """
         self._add_option('hold', hold)
 
+    def job_array(self, indexes = None):
+        """
+        TODO
+        """
+        # Iterators would be exhausted by the check, store a tuple instead
+        if indexes is not None and indexes is not False: indexes = tuple(indexes)
+        self._add_option('array', indexes, option_checks['indexes'])
+
     def add_dependencies(self, dep_type, jobs = None):
         """
         TODO
         Add a new dependency
         """
         assert_(dep_type in self.dependencies,
-                "dependency type must be one of %s" % ','.join(self.dependencies.keys()))
+                "dependency type must be one of %s", all_dep_types_list)
 
-        if dep_type == 'expand':
-            assert_(len(jobs) == 1 and valid_job(jobs[0]), "'expand' dependency type requires one job argument")
-            self.dependencies[dep_type] = jobs
-        elif dep_type == 'singleton':
+        if dep_type == 'singleton':
             assert_(jobs is None, "'singleton' dependency type does not require 'jobs' argument")
             self.dependencies[dep_type] = True
-        else:
+            return
+
+        assert_(jobs is not None, "'%s' dependency type requires 'jobs' argument", dep_type)
+        jobs = list(jobs)
+        assert_(all(valid_job(j) for j in jobs), "invalid list of jobs")
+        if dep_type == 'expand':
+            assert_(len(jobs) == 1, "'expand' dependency type requires one job argument")
             self.dependencies[dep_type] = jobs
+        else:
+            # Jobs are appended to the ones added before, already present jobs are skipped
+            deps = self.dependencies[dep_type]
+            for j in jobs:
+                if j not in deps: deps.append(j)
 
     def clear_dependencies(self, dep_type = None):
         """
@@ -490,7 +766,7 @@ class SLURMJob:
             for t in self.dependencies: self.dependencies[t] = []
         else:
             assert_(dep_type in self.dependencies,
-                    "dependency type must be one of %s" % ','.join(self.dependencies.keys()))
+                    "dependency type must be one of %s", all_dep_types_list)
             self.dependencies[dep_type] = []
 
     def dependencies_require_any(self, any = False):
@@ -509,41 +785,188 @@ class SLURMJob:
         """
         TODO
         """
+        if self._dump_cache is None:
+            if self._template is not None:
+                options = self._template.inherited_options(self.options, self._removed_options)
+                options.update(self.options)
+                for check, msg in merged_options_checks:
+                    assert_(check(options), msg)
+            self._dump_cache = self._render()
+        return self._dump_cache
+
+    # Job script encoded as UTF-8, reused as long as dump() returns the same object
+    def _encoded_dump(self):
+        script = self.dump()
+        if self._encoded_dump_cache is None or self._encoded_dump_cache[0] is not script:
+            self._encoded_dump_cache = (script, script.encode('utf-8'))
+        return self._encoded_dump_cache[1]
+
+    def _render(self):
         # Add shebang
-        t = "#!%s\n" % shell_path
+        parts = [shebang_line]
 
         # Generate header
-        for name in self.options:
-            arg = self.options[name]
-            if name in SLURMJob.renderers:
-                t += render_option(name, SLURMJob.renderers[name](arg))
-            elif arg is True:
-                t += render_option(name)
-            else:
-                t += render_option(name, str(arg))
+        if self._template is not None:
+            parts.append(self._template.render_header(self.options, self._removed_options))
+        parts.append(self._render_options(self.options))
 
-        t += render_option("parsable")
-        t += render_option("quiet")
+        parts.append(standard_option_lines)
         # Add body
-        t += self.body
-
-        return t
-
-def submit(job, sbatch_path = None):
+        parts.append(self.body)
+
+        return ''.join(parts)
+
+    # Format strings of '#SBATCH' headers, keyed by tuples of
+    # (option name, whether option has a value) pairs
+    header_formats = {}
+
+    @staticmethod
+    def _render_options(options):
+        get_renderer = SLURMJob.renderers.get
+        shape, values = [], []
+        add_shape, add_value = shape.append, values.append
+        for name, arg in options.items():
+            renderer = get_renderer(name)
+            if renderer is not None:
+                value = renderer(arg)
+            elif arg is True:
+                value = None
+            else:
+                value = str(arg)
+            add_shape((name, bool(value)))
+            if value: add_value(value)
+
+        shape = tuple(shape)
+        header_format = SLURMJob.header_formats.get(shape)
+        if header_format is None:
+            header_format = ''.join(render_option(name, '{}' if has_value else None)
+                                    for name, has_value in shape)
+            SLURMJob.header_formats[shape] = header_format
+        return header_format.format(*values)
+
+# Options set by SLURMJob constructor arguments
+constructor_options = {'job_name' : 'job-name',
+                       'partitions' : 'partition',
+                       'nodes' : 'nodes',
+                       'walltime' : 'time',
+                       'time_min' : 'time-min',
+                       'workdir' : 'workdir',
+                       'output' : 'output',
+                       'error' : 'error',
+                       'input' : 'input',
+                       'open_mode' : 'open-mode',
+                       'mail_user' : 'mail-user',
+                       'mail_type' : 'mail-type'}
+# SLURMJob constructor arguments that are checked against each other
+constructor_dependent_args = (('walltime', 'time_min'), ('mail_user', 'mail_type'))
+
+# Constructor arguments passed to SLURMJobTemplate.clone() override
+# the template's options, None or False unsets them. The same holds for setters
+# called on a clone later. Mutually exclusive options are checked against
+# the template's options when the clone is dumped, other options are checked
+# only against the clone's own options.
+class SLURMJobTemplate:
     """
     TODO
     """
-    assert_(isinstance(job, SLURMJob), "argument must be a SLURMJob object")
-
-    if sbatch_path is None:
-        sbatch_path = locate_executable('sbatch')
 
+    def __init__(self, job):
+        """
+        TODO
+        """
+        assert_(isinstance(job, SLURMJob) and job._template is None,
+                "argument must be a SLURMJob object not created from a template")
+        # Let derived classes adjust their options before taking a snapshot
+        job.dump()
+        self.job_class = type(job)
+        self.options = dict(job.options)
+        self.body = job.body
+        # Header lines shared by all clones
+        self.header = SLURMJob._render_options(self.options)
+
+    # Options a clone inherits, i.e. neither overridden nor unset by the clone
+    def inherited_options(self, overrides, removed):
+        return {name : arg for name, arg in self.options.items()
+                if name not in overrides and name not in removed}
+
+    def render_header(self, overrides, removed):
+        if not removed and not any(name in self.options for name in overrides):
+            return self.header
+        return SLURMJob._render_options(self.inherited_options(overrides, removed))
+
+    def clone(self, **kwargs):
+        """
+        TODO
+        """
+        kwargs.setdefault('body', self.body)
+        # Let the constructor check dependent arguments against the template's options
+        for args in constructor_dependent_args:
+            if any(a in kwargs for a in args):
+                for a in args:
+                    if a not in kwargs and constructor_options[a] in self.options:
+                        kwargs[a] = self.options[constructor_options[a]]
+
+        job = self.job_class(**kwargs)
+        job._template = self
+        job._removed_options = frozenset(constructor_options[a] for a in kwargs
+                                         if a in constructor_options and
+                                            constructor_options[a] in self.options and
+                                            constructor_options[a] not in job.options)
+        return job
+
+# Store job ID printed by 'sbatch --parsable' ('<job id>[;<cluster name>]')
+# and mark the job as submitted
+def store_job_id(job, stdoutdata):
+    job.job_id = int(stdoutdata.split(b';', 1)[0])
+    job.submitted = True
+
+# Submit a job unless another thread is submitting it already,
+# in which case wait until that submission is over.
+# With 'wait' also wait until the job terminates: join a submission that waits
+# for it, or submit the job again once a submission that does not wait is over.
+# A job that has been submitted before is submitted again only if 'resubmit' is set.
+def submit_once(job, sbatch_path, wait = False, resubmit = False):
+    while True:
+        with submissions_lock:
+            if job.submitted and not resubmit: return job.job_id
+            in_progress = submissions.get(id(job))
+            if in_progress is None:
+                submission = submissions[id(job)] = Submission(wait)
+                break
+            check_wait_cycle(in_progress.thread)
+            waiting_for[current_thread()] = id(job)
+
+        try:
+            (in_progress.finished if wait else in_progress.done).wait()
+        finally:
+            with submissions_lock:
+                del waiting_for[current_thread()]
+        if not job.submitted:
+            raise RuntimeError("failed to submit job '%s'" % job.options.get('job-name',''))
+        if not wait: return job.job_id
+        if in_progress.error is not None: raise RuntimeError(in_progress.error)
+        if in_progress.wait: return job.job_id
+
+    try:
+        return run_sbatch(job, sbatch_path, wait, submission.done)
+    except Exception as e:
+        submission.error = str(e)
+        raise
+    finally:
+        with submissions_lock:
+            del submissions[id(job)]
+        submission.done.set()
+        submission.finished.set()
+
+# Submit a job and the jobs it depends on by calling sbatch,
+# set event 'done' as soon as the job ID is known
+def run_sbatch(job, sbatch_path, wait, done):
     dep_ids = {k : [] for k in job.dependencies}
     for dep_type in job.dependencies:
         if dep_type == 'singleton': continue
         for dep in job.dependencies[dep_type]:
             if isinstance(dep, SLURMJob):
-                if not dep.submitted: submit(dep, sbatch_path)
+                submit_once(dep, sbatch_path)
                 dep_jobid = dep.job_id
             else:
                 dep_jobid = dep
@@ -557,25 +980,189 @@ def submit(job, sbatch_path = None):
     popen_args = [sbatch_path]
     if deps_str:
         popen_args += ['-d', deps_str]
-    p = Popen(popen_args, stdout = PIPE, stdin = PIPE, stderr = PIPE)
-    stdoutdata, stderrdata = p.communicate(job.dump().encode('utf-8'))
-    if p.returncode:
+    if wait:
+        popen_args.append('--wait')
+    if wait:
+        # With --wait sbatch prints the job ID right after submission, then
+        # blocks until the job terminates and exits with the job's exit code.
+        # Its error messages go to a temporary file, so that sbatch cannot block
+        # on a full stderr pipe while the job ID is being read.
+        with TemporaryFile() as stderr_file:
+            p = Popen(popen_args, stdout = PIPE, stdin = PIPE, stderr = stderr_file)
+            p.stdin.write(job._encoded_dump())
+            p.stdin.close()
+            stdoutdata = p.stdout.readline()
+            # Publish the job ID before blocking
+            submitted = bool(stdoutdata.strip())
+            if submitted:
+                store_job_id(job, stdoutdata)
+                done.set()
+            p.stdout.read()
+            p.stdout.close()
+            p.wait()
+            stderr_file.seek(0)
+            stderrdata = stderr_file.read()
+    else:
+        p = Popen(popen_args, stdout = PIPE, stdin = PIPE, stderr = PIPE)
+        stdoutdata, stderrdata = p.communicate(job._encoded_dump())
+        submitted = not p.returncode
+        if submitted: store_job_id(job, stdoutdata)
+
+    if not submitted:
         error_msg = "%s failed to submit job '%s' with the following error message:\n%s" \
                     % (sbatch_path, job.options.get('job-name',''), stderrdata.decode('utf-8'))
         raise RuntimeError(error_msg)
-    else:
+
+    # With --wait a non-zero exit code comes from the job itself
+    if p.returncode:
+        raise RuntimeError("job %i ('%s') terminated with exit code %i"
+                           % (job.job_id, job.options.get('job-name',''), p.returncode))
+    return job.job_id
+
+def submit(job, sbatch_path = None, wait = False):
+    """
+    TODO
+    """
+    assert_(isinstance(job, SLURMJob), "argument must be a SLURMJob object")
+
+    if sbatch_path is None:
+        sbatch_path = locate_executable('sbatch')
+
+    return submit_once(job, sbatch_path, wait, resubmit = True)
+
+def submit_and_wait(job, sbatch_path = None):
+    """
+    TODO
+    """
+    return submit(job, sbatch_path, wait = True)
+
+def submit_async(job, sbatch_path = None):
+    """
+    TODO
+    """
+    assert_(isinstance(job, SLURMJob), "argument must be a SLURMJob object")
+
+    if sbatch_path is None:
+        sbatch_path = locate_executable('sbatch')
+
+    return get_submit_pool().submit(submit, job, sbatch_path)
+
+def submit_all(jobs, sbatch_path = None, concurrency = None):
+    """
+    TODO
+    """
+    jobs = list(jobs)
+    assert_(all(isinstance(j, SLURMJob) for j in jobs), "invalid list of jobs")
+
+    if sbatch_path is None:
+        sbatch_path = locate_executable('sbatch')
+
+    # Collect all jobs to be submitted, including unsubmitted dependencies
+    pending, seen = [], set()
+    stack = [j for j in jobs if not j.submitted]
+    while stack:
+        job = stack.pop()
+        if id(job) in seen: continue
+        seen.add(id(job))
+        pending.append(job)
+        stack += pending_dependencies(job)
+
+    # Submit jobs in waves, every wave consists of jobs whose dependencies
+    # have already been submitted
+    pool = submission_pool(concurrency)
+    try:
+        while pending:
+            wave = [j for j in pending if not pending_dependencies(j)]
+            if not wave: raise RuntimeError("circular dependencies between jobs")
+            run_on_pool(pool, submit, wave, sbatch_path)
+            pending = [j for j in pending if not j.submitted]
+    finally:
+        if concurrency is not None: pool.shutdown()
+
+    return [job.job_id for job in jobs]
+
+# Submit array compatible jobs as one job array and assign them job IDs
+# of the form '<array job ID>_<index>'
+def submit_array(jobs, sbatch_path):
+    array_job = copy(jobs[0])
+    array_job.options = dict(jobs[0].options)
+    array_job.job_array(list(range(len(jobs))))
+    array_job.set_body(render_array_body([j.body for j in jobs]))
+    array_id = submit(array_job, sbatch_path)
+
+    for n, job in enumerate(jobs):
         job.submitted = True
-        job.job_id = int(parse_job_id_regexp.match(stdoutdata.decode('utf-8')).group(1))
-        return job.job_id
+        job.job_id = "%i_%i" % (array_id, n)
+
+# Submit a group of array compatible jobs, skipping those that have been
+# submitted as dependencies of other groups
+def submit_group(group, sbatch_path):
+    group = [j for j in group if not j.submitted]
+    if len(group) > 1:
+        submit_array(group, sbatch_path)
+    else:
+        for job in group: submit(job, sbatch_path)
 
-def chain_jobs(jobs, dep_type = 'afterany'):
+def submit_many(jobs, as_array = False, sbatch_path = None, concurrency = None):
     """
     TODO
     """
+    jobs = list(jobs)
     assert_(all(isinstance(j, SLURMJob) for j in jobs), "invalid list of jobs")
-    valid_dep_types = ('after','afterany','afternotok','afterok')
-    assert_(dep_type in valid_dep_types, "dependency type must be one of %s" % ','.join(valid_dep_types))
 
-    for n in range(len(jobs)-1):
-        jobs[n+1].add_dependencies(dep_type, [jobs[n]])
+    if sbatch_path is None:
+        sbatch_path = locate_executable('sbatch')
+
+    if not as_array:
+        return submit_all(jobs, sbatch_path, concurrency)
+
+    # Group jobs that differ only in their bodies
+    groups = []
+    for job in jobs:
+        for group in groups:
+            if array_compatible(group[0], job):
+                group.append(job)
+                break
+        else:
+            groups.append([job])
+
+    # Every group of two or more jobs becomes one job array.
+    # Groups are submitted in waves, every wave consists of groups
+    # that do not depend on jobs from the remaining groups
+    pool = submission_pool(concurrency)
+    try:
+        pending = groups
+        while pending:
+            pending_ids = {id(j) for group in pending for j in group}
+            wave = [group for group in pending
+                    if not any(id(dep) in pending_ids for dep in pending_dependencies(group[0]))]
+            if not wave: raise RuntimeError("circular dependencies between jobs")
+            run_on_pool(pool, submit_group, wave, sbatch_path)
+            pending = [group for group in pending if not all(j.submitted for j in group)]
+    finally:
+        if concurrency is not None: pool.shutdown()
+
+    # Jobs merged into arrays get IDs '<array job ID>_<index>',
+    # so all IDs are returned as strings
+    return [str(job.job_id) for job in jobs]
+
+def chain_jobs(jobs, dep_type = None):
+    """
+    TODO
+    """
+    if not isinstance(jobs, dict): jobs = list(jobs)
+    assert_(all(isinstance(j, SLURMJob) for j in jobs), "invalid list of jobs")
+    if dep_type is None: dep_type = default_dep_type
+    assert_(dep_type in chain_dep_types, "dependency type must be one of %s", chain_dep_types_list)
+
+    # Dependency graph {job : jobs it depends on}
+    if isinstance(jobs, dict):
+        for job, parents in jobs.items():
+            job.add_dependencies(dep_type, list(parents))
+        return
+
+    prev = None
+    for job in jobs:
+        if prev is not None: job.add_dependencies(dep_type, [prev])
+        prev = job
 
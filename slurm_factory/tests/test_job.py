@@ -1,7 +1,345 @@
+import os
+import sys
+import shutil
+import tempfile
 from unittest import TestCase
 
 from slurm_factory import job
 
+# sbatch replacement that stores its arguments and job script in files
+# job1, job2, ... and prints the job ID; with --wait it sleeps for the time
+# from a 'sleep <seconds>' line of the job script, creates a file done1,
+# done2, ... and exits with the code from an 'exit <code>' line
+fake_sbatch = """#!%s
+import os, re, sys, time
+script = sys.stdin.read()
+n = 1
+while True:
+    try:
+        fd = os.open(os.path.join(%r, "job%%i" %% n), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        break
+    except OSError:
+        n += 1
+os.write(fd, (" ".join(sys.argv[1:]) + "\\n" + script).encode())
+os.close(fd)
+sys.stdout.write("%%i\\n" %% n)
+sys.stdout.flush()
+if "--wait" in sys.argv:
+    m = re.search(r"^sleep (\\d+)$", script, re.M)
+    if m: time.sleep(int(m.group(1)))
+    open(os.path.join(%r, "done%%i" %% n), "w").close()
+    m = re.search(r"^exit (\\d+)$", script, re.M)
+    if m: sys.exit(int(m.group(1)))
+"""
+
 class TestJob(TestCase):
+    def make_sbatch(self):
+        self.sbatch_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.sbatch_dir)
+        path = os.path.join(self.sbatch_dir, "sbatch")
+        with open(path, "w") as f:
+            f.write(fake_sbatch % (sys.executable, self.sbatch_dir, self.sbatch_dir))
+        os.chmod(path, 0o755)
+        return path
+
+    def sbatch_calls(self):
+        calls = {}
+        for name in os.listdir(self.sbatch_dir):
+            if name.startswith("job"):
+                with open(os.path.join(self.sbatch_dir, name)) as f:
+                    calls[int(name[3:])] = f.read()
+        return [calls[n] for n in sorted(calls)]
+
     def test1(self):
         pass
+
+    def test_format_array_indexes(self):
+        self.assertEqual(job.format_array_indexes([0, 2, 3, 5]), "0,2-3,5")
+        self.assertEqual(job.format_array_indexes([3, 1, 2, 2]), "1-3")
+        self.assertEqual(job.format_array_indexes([7]), "7")
+
+    def test_render_array_body(self):
+        self.assertEqual(job.render_array_body(["echo a\n", "echo b"]),
+                         "case $SLURM_ARRAY_TASK_ID in\n0)\necho a\n;;\n1)\necho b\n;;\nesac\n")
+
+    def test_submit_array(self):
+        sbatch = self.make_sbatch()
+        jobs = [job.SLURMJob(job_name = "a", body = "echo %i\n" % n) for n in range(3)]
+        ids = job.submit_many(jobs, as_array = True, sbatch_path = sbatch)
+        self.assertEqual(ids, ["1_0", "1_1", "1_2"])
+        script = self.sbatch_calls()[0]
+        self.assertEqual(script.count("#SBATCH --job-name=a\n"), 1)
+        self.assertIn("#SBATCH --array=0-2\n", script)
+        self.assertTrue(script.endswith(job.render_array_body([j.body for j in jobs])))
+        self.assertNotIn("--array", jobs[0].dump())
+        jobs[0].job_array(n for n in (0, 2, 3))
+        self.assertIn("#SBATCH --array=0,2-3\n", jobs[0].dump())
+        self.assertRaises(AssertionError, jobs[0].job_array, iter([]))
+
+    def test_dump_cache(self):
+        j = job.SLURMJob(job_name = "test")
+        d = j.dump()
+        self.assertIs(j.dump(), d)
+        j.workdir("/tmp")
+        self.assertIn("#SBATCH --workdir=/tmp\n", j.dump())
+        j.set_body("hostname\n")
+        self.assertTrue(j.dump().endswith("hostname\n"))
+        j.requeue(True)
+        self.assertIn("#SBATCH --requeue\n", j.dump())
+
+    def test_chain_jobs(self):
+        jobs = [job.SLURMJob(job_name = "job%i" % n) for n in range(3)]
+        job.chain_jobs(jobs, 'afterok')
+        jobs[0].add_dependencies('afterok', [123])
+        jobs[1].add_dependencies('afterok', [456])
+        self.assertEqual(jobs[0].dependencies['afterok'], [123])
+        self.assertEqual(jobs[1].dependencies['afterok'], [jobs[0], 456])
+        self.assertEqual(jobs[2].dependencies['afterok'], [jobs[1]])
+        job.chain_jobs(jobs, 'afterok')
+        jobs[1].add_dependencies('afterok', iter([456, 789]))
+        self.assertEqual(jobs[1].dependencies['afterok'], [jobs[0], 456, 789])
+        self.assertEqual(jobs[2].dependencies['afterok'], [jobs[1]])
+        self.assertRaises(AssertionError, jobs[0].add_dependencies, 'afterok')
+        self.assertRaises(AssertionError, jobs[0].add_dependencies, 'afterok', ["job"])
+
+    def test_chain_jobs_iterator(self):
+        a, b = job.SLURMJob(), job.SLURMJob()
+        job.chain_jobs(iter([a, b]), 'afterok')
+        self.assertEqual(b.dependencies['afterok'], [a])
+
+    def test_template(self):
+        proto = job.SLURMJob(job_name = "proto", nodes = 4)
+        proto.workdir("/tmp")
+        tmpl = job.SLURMJobTemplate(proto)
+        j1 = tmpl.clone(body = "hostname\n")
+        j2 = tmpl.clone(job_name = "clone")
+        self.assertEqual(j1.dump(), proto.dump() + "hostname\n")
+        self.assertIn("#SBATCH --job-name=clone\n", j2.dump())
+        self.assertNotIn("#SBATCH --job-name=proto\n", j2.dump())
+        self.assertIn("#SBATCH --workdir=/tmp\n", j2.dump())
+
+    def test_template_overrides(self):
+        from datetime import timedelta
+        proto = job.SLURMJob(job_name = "proto", walltime = timedelta(hours = 2),
+                             time_min = timedelta(hours = 1))
+        tmpl = job.SLURMJobTemplate(proto)
+        j = tmpl.clone(job_name = None)
+        self.assertNotIn("--job-name", j.dump())
+        self.assertIn("#SBATCH --time=02:00:00\n", j.dump())
+        j = tmpl.clone(walltime = timedelta(hours = 3))
+        self.assertIn("#SBATCH --time=03:00:00\n", j.dump())
+        self.assertIn("#SBATCH --time-min=01:00:00\n", j.dump())
+        self.assertNotIn("--time=02:00:00", j.dump())
+        self.assertRaises(AssertionError, tmpl.clone, walltime = timedelta(minutes = 30))
+        self.assertFalse(job.array_compatible(tmpl.clone(job_name = False), tmpl.clone()))
+
+    def test_template_setters(self):
+        proto = job.SLURMJob(job_name = "proto", nodes = 4)
+        proto.job_streams(output = "out.txt", error = "err.txt")
+        proto.constraints(mem = "1G")
+        proto.requeue(True)
+        tmpl = job.SLURMJobTemplate(proto)
+        j = tmpl.clone()
+        j.job_streams(output = None)
+        j.nodes_allocation(None)
+        self.assertNotIn("--output", j.dump())
+        self.assertNotIn("--nodes", j.dump())
+        self.assertIn("#SBATCH --error=err.txt\n", j.dump())
+        j.requeue(False)
+        self.assertIn("#SBATCH --no-requeue\n", j.dump())
+        self.assertNotIn("#SBATCH --requeue\n", j.dump())
+        j = tmpl.clone()
+        j.constraints(mem_per_cpu = "1G")
+        self.assertRaises(AssertionError, j.dump)
+        j.constraints(mem = None)
+        self.assertIn("#SBATCH --mem-per-cpu=1G\n", j.dump())
+
+    def test_submit_all(self):
+        sbatch = self.make_sbatch()
+        jobs = [job.SLURMJob(job_name = "job%i" % n, body = "echo %i\n" % n) for n in range(3)]
+        job.chain_jobs(jobs, 'afterok')
+        ids = job.submit_all(reversed(jobs), sbatch, concurrency = 2)
+        self.assertEqual(ids, [3, 2, 1])
+        calls = self.sbatch_calls()
+        self.assertIn("#SBATCH --job-name=job0\n", calls[0])
+        self.assertTrue(calls[1].startswith("-d afterok:1\n"))
+        self.assertTrue(calls[2].startswith("-d afterok:2\n"))
+        self.assertTrue(all(j.submitted for j in jobs))
+
+    def test_submit_cycle(self):
+        sbatch = self.make_sbatch()
+        a, b = job.SLURMJob(job_name = "a"), job.SLURMJob(job_name = "b")
+        a.add_dependencies('afterok', [b])
+        b.add_dependencies('afterok', [a])
+        self.assertRaises(RuntimeError, job.submit_all, [a, b], sbatch)
+        self.assertRaises(RuntimeError, job.submit_many, [a, b], True, sbatch)
+        self.assertRaises(RuntimeError, job.submit, a, sbatch)
+        for f in [job.submit_async(a, sbatch), job.submit_async(b, sbatch)]:
+            self.assertRaises(RuntimeError, f.result, 60)
+        self.assertEqual(self.sbatch_calls(), [])
+
+    def test_submit_all_in_pool(self):
+        sbatch = self.make_sbatch()
+        pool = job.get_submit_pool()
+        chains = [[job.SLURMJob(body = "echo %i\n" % n) for n in range(2)] for c in range(pool._max_workers)]
+        for chain in chains: job.chain_jobs(chain, 'afterok')
+        for f in [pool.submit(job.submit_all, chain, sbatch) for chain in chains]: f.result(60)
+        self.assertTrue(all(j.submitted for chain in chains for j in chain))
+
+    def test_signal(self):
+        j = job.SLURMJob()
+        j.signal('USR1')
+        self.assertIn("#SBATCH --signal=USR1\n", j.dump())
+        j.signal('USR2', 60, True)
+        self.assertIn("#SBATCH --signal=B:USR2@60\n", j.dump())
+        j.signal()
+        self.assertNotIn("--signal", j.dump())
+
+    def test_export_env(self):
+        j = job.SLURMJob()
+        j.export_env(export_file = "export.txt")
+        self.assertIn("#SBATCH --export-file=export.txt\n", j.dump())
+        j.export_env(export_vars = 'NONE', set_vars = {'A' : 1})
+        self.assertIn("#SBATCH --export=NONE,A=1\n", j.dump())
+        self.assertNotIn("--export-file", j.dump())
+
+    def test_format_timedelta(self):
+        from datetime import timedelta
+        self.assertEqual(job.format_timedelta(timedelta(seconds = 59)), "00:59")
+        self.assertEqual(job.format_timedelta(timedelta(minutes = 59, seconds = 59)), "59:59")
+        self.assertEqual(job.format_timedelta(timedelta(hours = 1)), "01:00:00")
+        self.assertEqual(job.format_timedelta(timedelta(hours = 23, minutes = 5, seconds = 7)), "23:05:07")
+        self.assertEqual(job.format_timedelta(timedelta(days = 2, seconds = 61)), "2-00:01:01")
+        self.assertEqual(job.format_timedelta(timedelta(seconds = -100000)), "1213:20")
+        self.assertEqual(job.format_timedelta(timedelta(seconds = -60)), "1439:00")
+
+    def test_email(self):
+        j = job.SLURMJob()
+        j.email("user@example.org", ["END"])
+        self.assertIn("#SBATCH --mail-user=user@example.org\n", j.dump())
+        self.assertRaises(AssertionError, j.email, "user@example.org\n", ["END"])
+
+    def test_chain_jobs_graph(self):
+        pre, a, b, post = [job.SLURMJob(job_name = n) for n in ("pre", "a", "b", "post")]
+        job.chain_jobs({a : [pre], b : [pre], post : [a, b]}, 'afterok')
+        self.assertEqual(a.dependencies['afterok'], [pre])
+        self.assertEqual(b.dependencies['afterok'], [pre])
+        self.assertEqual(post.dependencies['afterok'], [a, b])
+        self.assertEqual(pre.dependencies['afterok'], [])
+
+    def test_encoded_dump_cache(self):
+        j = job.SLURMJob(job_name = "test")
+        b = j._encoded_dump()
+        self.assertIs(j._encoded_dump(), b)
+        j.set_body("hostname\n")
+        self.assertEqual(j._encoded_dump(), j.dump().encode('utf-8'))
+
+    def test_submit_wait(self):
+        sbatch = self.make_sbatch()
+        self.assertEqual(job.submit(job.SLURMJob(body = "exit 0\n"), sbatch, wait = True), 1)
+        self.assertTrue(self.sbatch_calls()[0].startswith("--wait\n"))
+        j = job.SLURMJob(job_name = "failing", body = "exit 3\n")
+        with self.assertRaises(RuntimeError) as cm:
+            job.submit(j, sbatch, wait = True)
+        self.assertIn("job 2 ('failing') terminated with exit code 3", str(cm.exception))
+        self.assertTrue(j.submitted)
+        self.assertEqual(j.job_id, 2)
+
+    def test_submit_wait_joined(self):
+        from threading import Thread
+        from time import sleep
+        sbatch = self.make_sbatch()
+        j = job.SLURMJob(job_name = "slow", body = "sleep 1\n")
+        t = Thread(target = job.submit_and_wait, args = (j, sbatch))
+        t.start()
+        while not j.submitted: sleep(0.01)
+        self.assertEqual(job.submit_and_wait(j, sbatch), 1)
+        self.assertTrue(os.path.exists(os.path.join(self.sbatch_dir, "done1")))
+        t.join()
+        self.assertEqual(len(self.sbatch_calls()), 1)
+
+    def test_gres_licenses_iterators(self):
+        j = job.SLURMJob()
+        j.constraints(gres = (g for g in ["mic", ("gpu", 2, "kepler")]))
+        j.licenses(iter([("foo", 4), "bar"]))
+        self.assertIn("#SBATCH --gres=mic,gpu:kepler:2\n", j.dump())
+        self.assertIn("#SBATCH --licenses=foo:4,bar\n", j.dump())
+        self.assertRaises(AssertionError, j.licenses, [("foo", "4")])
+
+    def test_unset_with_false(self):
+        j = job.SLURMJob(partitions = ["batch"])
+        j.clusters(["cluster1"])
+        j.constraints(gres = ["mic"])
+        j.licenses(["foo"])
+        j.partitions(False)
+        j.clusters(False)
+        j.constraints(gres = False)
+        j.licenses(False)
+        self.assertNotIn("--partition", j.dump())
+        self.assertNotIn("--clusters", j.dump())
+        self.assertNotIn("--gres", j.dump())
+        self.assertNotIn("--licenses", j.dump())
+
+    def test_partitions_clusters(self):
+        j = job.SLURMJob(partitions = "debug", nodes = 2)
+        j.clusters(c for c in ("cluster1", "cluster2"))
+        self.assertIn("#SBATCH --partition=debug\n", j.dump())
+        self.assertIn("#SBATCH --nodes=2\n", j.dump())
+        self.assertIn("#SBATCH --clusters=cluster1,cluster2\n", j.dump())
+        j.partitions(["batch", "mem"])
+        j.nodes_allocation(2, 4)
+        self.assertIn("#SBATCH --partition=batch,mem\n", j.dump())
+        self.assertIn("#SBATCH --nodes=2-4\n", j.dump())
+
+    def test_array_compatible(self):
+        j1 = job.SLURMJob(job_name = "a", body = "echo 1\n")
+        j2 = job.SLURMJob(job_name = "a", body = "echo 2\n")
+        self.assertTrue(job.array_compatible(j1, j2))
+        self.assertFalse(job.array_compatible(j1, job.SLURMJob(job_name = "b")))
+        j2.job_array([0, 1])
+        self.assertFalse(job.array_compatible(j1, j2))
+        tmpl = job.SLURMJobTemplate(j2)
+        self.assertFalse(job.array_compatible(tmpl.clone(), tmpl.clone()))
+        self.assertFalse(job.array_compatible(j1, job.SLURMJob(job_name = "a", body = "#SBATCH --mem=1G\n")))
+
+    def test_submit_many_non_posix_shell(self):
+        sbatch = self.make_sbatch()
+        self.addCleanup(setattr, job, 'shell_path', job.shell_path)
+        job.shell_path = "/bin/tcsh"
+        jobs = [job.SLURMJob(job_name = "a", body = "echo %i\n" % n) for n in range(2)]
+        self.assertFalse(job.array_compatible(jobs[0], jobs[1]))
+        self.assertEqual(sorted(job.submit_many(jobs, as_array = True, sbatch_path = sbatch)), ["1", "2"])
+        self.assertFalse(any("--array" in call for call in self.sbatch_calls()))
+
+    def test_submit_many_groups(self):
+        sbatch = self.make_sbatch()
+        proto = job.SLURMJob(job_name = "arr")
+        proto.job_array([0, 1])
+        tmpl = job.SLURMJobTemplate(proto)
+        jobs = [job.SLURMJob(job_name = "a", body = "echo %i\n" % n) for n in range(3)]
+        jobs += [job.SLURMJob(job_name = "b", body = "echo b\n")]
+        jobs += [tmpl.clone(body = "echo %i\n" % n) for n in range(2)]
+        ids = job.submit_many(jobs, as_array = True, sbatch_path = sbatch)
+
+        calls = self.sbatch_calls()
+        self.assertEqual(len(calls), 4)
+        array_id = int(ids[0].split('_')[0])
+        self.assertEqual(ids[:3], ["%i_%i" % (array_id, n) for n in range(3)])
+        self.assertIn("#SBATCH --array=0-2\n", calls[array_id - 1])
+        self.assertEqual(sorted(int(n) for n in ids[3:] + [array_id]), [1, 2, 3, 4])
+        for n in ids[4:]:
+            self.assertIn("#SBATCH --array=0-1\n", calls[int(n) - 1])
+
+    def test_submit_many_array_dependencies(self):
+        sbatch = self.make_sbatch()
+        pre = job.SLURMJob(job_name = "pre", body = "echo pre\n")
+        jobs = [job.SLURMJob(job_name = "a", body = "echo %i\n" % n) for n in range(2)]
+        for j in jobs: j.add_dependencies('afterok', [pre])
+        ids = job.submit_many(jobs + [pre], as_array = True, sbatch_path = sbatch, concurrency = 2)
+        self.assertEqual(ids, ["2_0", "2_1", "1"])
+        self.assertTrue(self.sbatch_calls()[1].startswith("-d afterok:1\n"))
+        post = job.SLURMJob(job_name = "post", body = "echo post\n")
+        post.add_dependencies('afterok', ids[:2])
+        job.submit(post, sbatch)
+        self.assertTrue(self.sbatch_calls()[2].startswith("-d afterok:2_0:2_1\n"))
+        self.assertRaises(AssertionError, job.submit_many, [pre], True, sbatch, 0)
@@ -20,11 +20,8 @@
 #
 ###################################################################################
 
-# Python 2/3 compatibility
-from __future__ import absolute_import, unicode_literals
-
 import os
-import re
+from shutil import which
 from subprocess import check_output
 
 def version_info():
@@ -33,26 +30,37 @@ def version_info():
 def version():
     return '.'.join(map(str, version_info()))
 
+# Located executables, keyed by (name, value of $PATH)
+executables_cache = {}
+
 # Locate executable
 def locate_executable(name):
-    for path in os.environ["PATH"].split(os.pathsep):
-        p = os.path.join(path, name)
-        if os.access(p, os.X_OK): return p
-    raise RuntimeError("Could not locate '%s' executable" % name)
+    key = (name, os.environ["PATH"])
+    if key not in executables_cache:
+        p = which(name, path = key[1])
+        if p is None:
+            raise RuntimeError("Could not locate '%s' executable" % name)
+        executables_cache[key] = p
+    return executables_cache[key]
+
+# Outputs of 'sbatch --version', keyed by sbatch path
+slurm_versions_cache = {}
 
 def slurm_version(sbatch_path = None):
     if sbatch_path is None:
-        sbatch_path = locate_sbatch_executable()
-    output = check_output([sbatch_path, '--version'])
-    return output.decode('utf-8').strip()
+        sbatch_path = locate_executable('sbatch')
+    if sbatch_path not in slurm_versions_cache:
+        output = check_output([sbatch_path, '--version'])
+        slurm_versions_cache[sbatch_path] = output.decode('utf-8').strip()
+    return slurm_versions_cache[sbatch_path]
 
 def slurm_version_info(sbatch_path = None):
     if sbatch_path is None:
-        sbatch_path = locate_sbatch_executable()
+        sbatch_path = locate_executable('sbatch')
     sv = slurm_version(sbatch_path).replace('slurm', '').strip()
     def to_int_checked(x):
         try:
             return int(x)
         except ValueError:
             return x
-    return tuple(map(to_int_checked, re.split('[\.-]', sv)))
+    return tuple(map(to_int_checked, sv.replace('-', '.').split('.')))